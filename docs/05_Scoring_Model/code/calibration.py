@@ -6,9 +6,14 @@ Used to ensure that predicted probabilities match actual accuracy rates.
 """
 
 from dataclasses import dataclass
-from typing import Tuple
+from typing import Dict, Optional, Tuple
 import numpy as np
 
+try:
+    from . import instrumentation
+except ImportError:
+    import instrumentation
+
 
 @dataclass
 class TempFit:
@@ -17,6 +22,7 @@ class TempFit:
     nll_before: float
     nll_after: float
     improvement: float
+    instrumentation: Optional[Dict[str, Dict[str, float]]] = None
 
 
 def softmax(scores: np.ndarray, temperature: float = 1.0) -> np.ndarray:
@@ -84,29 +90,33 @@ def fit_temperature(
     
     Returns:
         TempFit with optimal temperature and NLL improvement
+        (`instrumentation` holds a per-stage summary when instrumentation is enabled)
     """
-    raw_scores = np.array(raw_scores)
-    labels = np.array(labels, dtype=int)
-    
-    # Compute baseline NLL with T=1.0
-    base_probs = softmax(raw_scores, temperature=1.0)
-    correct_probs = base_probs[np.arange(len(labels)), labels]
-    nll_base = nll(correct_probs, np.ones_like(correct_probs))
-    
-    best_temp = 1.0
-    best_nll = nll_base
-    
-    # Search for optimal temperature
-    temperatures = np.linspace(search_range[0], search_range[1], n_steps)
-    
-    for temp in temperatures:
-        probs = softmax(raw_scores, temperature=temp)
-        correct_probs = probs[np.arange(len(labels)), labels]
-        loss = nll(correct_probs, np.ones_like(correct_probs))
+    with instrumentation.collect() as collector:
+        with instrumentation.stage(instrumentation.STAGE_INGEST, rows=len(labels)):
+            raw_scores = np.array(raw_scores)
+            labels = np.array(labels, dtype=int)
         
-        if loss < best_nll:
-            best_nll = loss
-            best_temp = temp
+        with instrumentation.stage(instrumentation.STAGE_TEMPERATURE_SEARCH, rows=len(labels)):
+            # Compute baseline NLL with T=1.0
+            base_probs = softmax(raw_scores, temperature=1.0)
+            correct_probs = base_probs[np.arange(len(labels)), labels]
+            nll_base = nll(correct_probs, np.ones_like(correct_probs))
+            
+            best_temp = 1.0
+            best_nll = nll_base
+            
+            # Search for optimal temperature
+            temperatures = np.linspace(search_range[0], search_range[1], n_steps)
+            
+            for temp in temperatures:
+                probs = softmax(raw_scores, temperature=temp)
+                correct_probs = probs[np.arange(len(labels)), labels]
+                loss = nll(correct_probs, np.ones_like(correct_probs))
+                
+                if loss < best_nll:
+                    best_nll = loss
+                    best_temp = temp
     
     improvement = nll_base - best_nll
     
@@ -114,10 +124,89 @@ def fit_temperature(
         temperature=best_temp,
         nll_before=nll_base,
         nll_after=best_nll,
-        improvement=improvement
+        improvement=improvement,
+        instrumentation=collector.summary()
     )
 
 
+class TemperatureAccumulator:
+    """
+    Streaming version of `fit_temperature`
+    
+    Accumulates the summed NLL of every candidate temperature block by block,
+    so the optimal temperature is found in a single pass over the data
+    without materializing probabilities for the whole sample.
+    """
+    
+    def __init__(
+        self,
+        search_range: Tuple[float, float] = (0.1, 5.0),
+        n_steps: int = 100
+    ):
+        self.temperatures = np.linspace(search_range[0], search_range[1], n_steps)
+        self.loss_sums = np.zeros(n_steps)
+        self.base_loss_sum = 0.0
+        self.n_samples = 0
+    
+    def add(
+        self,
+        raw_scores: np.ndarray,
+        labels: np.ndarray,
+        base_probs: Optional[np.ndarray] = None
+    ) -> None:
+        """
+        Accumulate one block
+        
+        Args:
+            raw_scores: Shape (n_block, n_candidates) - raw model scores
+            labels: Shape (n_block,) - correct candidate index for each sample
+            base_probs: Softmax of raw_scores at T=1.0, if already computed
+        """
+        raw_scores = np.asarray(raw_scores)
+        labels = np.asarray(labels, dtype=int)
+        rows = np.arange(len(labels))
+        
+        if base_probs is None:
+            base_probs = softmax(raw_scores, temperature=1.0)
+        self.base_loss_sum += _nll_sum(base_probs[rows, labels])
+        for i, temp in enumerate(self.temperatures):
+            probs = softmax(raw_scores, temperature=temp)
+            self.loss_sums[i] += _nll_sum(probs[rows, labels])
+        self.n_samples += len(labels)
+    
+    def result(self) -> TempFit:
+        """
+        Returns:
+            TempFit with optimal temperature and NLL improvement
+        """
+        if self.n_samples == 0:
+            raise ValueError("Empty input arrays")
+        
+        nll_base = self.base_loss_sum / self.n_samples
+        best_temp = 1.0
+        best_nll = nll_base
+        
+        for temp, loss_sum in zip(self.temperatures, self.loss_sums):
+            loss = loss_sum / self.n_samples
+            if loss < best_nll:
+                best_nll = loss
+                best_temp = temp
+        
+        return TempFit(
+            temperature=best_temp,
+            nll_before=nll_base,
+            nll_after=best_nll,
+            improvement=nll_base - best_nll
+        )
+
+
+def _nll_sum(predictions: np.ndarray) -> float:
+    """Summed (not averaged) NLL, so blocks can be combined exactly"""
+    eps = 1e-15
+    clipped = np.clip(predictions, eps, 1 - eps)
+    return -np.sum(np.log(clipped))
+
+
 def expected_calibration_error(
     predicted_probs: np.ndarray,
     labels: np.ndarray,
@@ -137,25 +226,79 @@ def expected_calibration_error(
     Returns:
         ECE value in [0, 1]
     """
-    predicted_probs = np.array(predicted_probs)
-    labels = np.array(labels)
+    with instrumentation.stage(instrumentation.STAGE_INGEST, rows=len(labels)):
+        predicted_probs = np.array(predicted_probs)
+        labels = np.array(labels)
     
     bins = np.linspace(0, 1, n_bins + 1)
     ece = 0.0
     
-    for i in range(n_bins):
-        mask = (predicted_probs >= bins[i]) & (predicted_probs < bins[i+1])
-        
-        if np.sum(mask) > 0:
-            bin_accuracy = np.mean(labels[mask])
-            bin_confidence = np.mean(predicted_probs[mask])
-            bin_size = np.sum(mask) / len(labels)
+    with instrumentation.stage(instrumentation.STAGE_ECE, rows=len(labels)):
+        for i in range(n_bins):
+            mask = (predicted_probs >= bins[i]) & (predicted_probs < bins[i+1])
             
-            ece += np.abs(bin_accuracy - bin_confidence) * bin_size
+            if np.sum(mask) > 0:
+                bin_accuracy = np.mean(labels[mask])
+                bin_confidence = np.mean(predicted_probs[mask])
+                bin_size = np.sum(mask) / len(labels)
+                
+                ece += np.abs(bin_accuracy - bin_confidence) * bin_size
     
     return ece
 
 
+class ECEAccumulator:
+    """
+    Streaming version of `expected_calibration_error`
+    
+    Keeps per-bin counts, summed confidence and summed accuracy, so ECE can
+    be computed block by block with the same binning as the batch function.
+    """
+    
+    def __init__(self, n_bins: int = 10):
+        self.bins = np.linspace(0, 1, n_bins + 1)
+        self.counts = np.zeros(n_bins)
+        self.confidence_sums = np.zeros(n_bins)
+        self.accuracy_sums = np.zeros(n_bins)
+        self.n_samples = 0
+    
+    def add(self, predicted_probs: np.ndarray, labels: np.ndarray) -> None:
+        """
+        Accumulate one block
+        
+        Args:
+            predicted_probs: Predicted probabilities for correct class
+            labels: Ground truth labels (0 or 1, or correct=1)
+        """
+        predicted_probs = np.asarray(predicted_probs, dtype=float)
+        labels = np.asarray(labels, dtype=float)
+        n_bins = len(self.counts)
+        
+        # Bin i holds bins[i] <= p < bins[i+1]; p outside [0, 1) falls in no bin
+        idx = np.searchsorted(self.bins, predicted_probs, side='right') - 1
+        valid = (idx >= 0) & (idx < n_bins)
+        
+        self.counts += np.bincount(idx[valid], minlength=n_bins)
+        self.confidence_sums += np.bincount(idx[valid], weights=predicted_probs[valid], minlength=n_bins)
+        self.accuracy_sums += np.bincount(idx[valid], weights=labels[valid], minlength=n_bins)
+        self.n_samples += len(labels)
+    
+    def value(self) -> float:
+        """
+        Returns:
+            ECE value in [0, 1]
+        """
+        if self.n_samples == 0:
+            return 0.0
+        
+        filled = self.counts > 0
+        bin_accuracy = self.accuracy_sums[filled] / self.counts[filled]
+        bin_confidence = self.confidence_sums[filled] / self.counts[filled]
+        bin_size = self.counts[filled] / self.n_samples
+        
+        return float(np.sum(np.abs(bin_accuracy - bin_confidence) * bin_size))
+
+
 def apply_temperature_scaling(
     raw_scores: np.ndarray,
     temperature: float
@@ -191,8 +334,9 @@ def platt_scaling_coefficients(
     """
     from scipy.optimize import minimize
     
-    raw_scores = np.array(raw_scores).flatten()
-    labels = np.array(labels)
+    with instrumentation.stage(instrumentation.STAGE_INGEST, rows=len(labels)):
+        raw_scores = np.array(raw_scores).flatten()
+        labels = np.array(labels)
     
     def platt_loss(params):
         a, b = params
@@ -202,7 +346,8 @@ def platt_scaling_coefficients(
         probs = np.clip(probs, eps, 1 - eps)
         return -np.mean(labels * np.log(probs) + (1 - labels) * np.log(1 - probs))
     
-    result = minimize(platt_loss, [1.0, 0.0], method='Nelder-Mead')
+    with instrumentation.stage(instrumentation.STAGE_PLATT, rows=len(labels)):
+        result = minimize(platt_loss, [1.0, 0.0], method='Nelder-Mead')
     
     return tuple(result.x)
 
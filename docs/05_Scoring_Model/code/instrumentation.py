@@ -0,0 +1,296 @@
+"""
+Per-Stage Timing and Memory Instrumentation
+
+This module provides an opt-in instrumentation layer for the scoring-model
+batch code (threshold optimization and calibration). Each instrumented stage
+records wall time, call count, rows processed and peak allocated bytes, and
+emits the record to a pluggable sink (JSON lines file or in-memory collector).
+
+Instrumentation is disabled by default. While disabled, `stage()` and
+`collect()` return a shared no-op object, so the batch code pays only a
+single global lookup per stage.
+
+Memory tracing (tracemalloc) is opt-in as well: it hooks every allocation
+and slows Python-loop stages (sort, ROC sweep) far more than numpy stages,
+so wall times are only comparable across stages when tracing is off.
+"""
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional
+
+
+# Stage names used by threshold_optimizer, calibration and pipeline
+STAGE_INGEST = 'ingest'
+STAGE_SORT = 'sort'
+STAGE_ROC_SWEEP = 'roc_sweep'
+STAGE_TEMPERATURE_SEARCH = 'temperature_search'
+STAGE_ECE = 'ece'
+STAGE_PLATT = 'platt'
+STAGE_P_MIS = 'p_mis'
+
+
+@dataclass
+class StageRecord:
+    """Measurement of a single execution of an instrumented stage"""
+    stage: str
+    wall_time: float
+    calls: int
+    rows: int
+    peak_bytes: int
+    memory_traced: bool = False
+
+
+class MemorySink:
+    """Sink that keeps every record in memory"""
+
+    def __init__(self):
+        self.records: List[StageRecord] = []
+
+    def emit(self, record: StageRecord) -> None:
+        self.records.append(record)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Aggregate all collected records per stage"""
+        return summarize(self.records)
+
+
+class JsonLinesSink:
+    """Sink that appends one JSON object per record to a file"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def emit(self, record: StageRecord) -> None:
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(asdict(record)) + '\n')
+
+
+class _NullStage:
+    """No-op stand-in returned by `stage()` and `collect()` when disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add_rows(self, n: int) -> None:
+        pass
+
+    def summary(self) -> Optional[Dict[str, Dict[str, float]]]:
+        return None
+
+
+_NULL = _NullStage()
+
+
+class _State:
+    """Active instrumentation configuration"""
+
+    def __init__(self, sink, trace_memory: bool, previous: Optional['_State'] = None):
+        self.sink = sink
+        self.trace_memory = trace_memory
+        self.started_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        # Peaks are only measured when this module owns tracing; resetting the
+        # peak of a caller-started trace would wipe out their measurement
+        self.owns_tracing = trace_memory and (
+            self.started_tracing or (previous is not None and previous.owns_tracing)
+        )
+        # Shared with an enclosing `instrumented()` block so peaks carry over
+        self.open_stages: List['_Stage'] = previous.open_stages if previous is not None else []
+        self.collectors: List['_Collector'] = []
+
+    def close(self) -> None:
+        if self.started_tracing:
+            tracemalloc.stop()
+
+
+_state: Optional[_State] = None
+
+
+class _Stage:
+    """Context manager measuring one execution of a stage"""
+
+    def __init__(self, state: _State, name: str, rows: int):
+        self.state = state
+        self.name = name
+        self.rows = rows
+        self.start = 0.0
+        self.mem_base = 0
+        self.mem_peak = 0
+
+    def add_rows(self, n: int) -> None:
+        self.rows += int(n)
+
+    def __enter__(self):
+        if self.state.owns_tracing:
+            self.mem_base = tracemalloc.get_traced_memory()[0]
+            # Nested stages reset the shared peak; carry it over to the parent
+            if self.state.open_stages:
+                parent = self.state.open_stages[-1]
+                parent.mem_peak = max(parent.mem_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.state.open_stages.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_time = time.perf_counter() - self.start
+        self.state.open_stages.pop()
+
+        peak_bytes = 0
+        if self.state.owns_tracing:
+            peak = max(self.mem_peak, tracemalloc.get_traced_memory()[1])
+            peak_bytes = max(0, peak - self.mem_base)
+            if self.state.open_stages:
+                parent = self.state.open_stages[-1]
+                parent.mem_peak = max(parent.mem_peak, peak)
+
+        record = StageRecord(
+            stage=self.name,
+            wall_time=wall_time,
+            calls=1,
+            rows=self.rows,
+            peak_bytes=peak_bytes,
+            memory_traced=self.state.owns_tracing
+        )
+        self.state.sink.emit(record)
+        for collector in self.state.collectors:
+            collector.records.append(record)
+        return False
+
+
+class _Collector:
+    """Context manager capturing the records emitted while it is open"""
+
+    def __init__(self, state: _State):
+        self.state = state
+        self.records: List[StageRecord] = []
+
+    def __enter__(self):
+        self.state.collectors.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.state.collectors.remove(self)
+        return False
+
+    def summary(self) -> Optional[Dict[str, Dict[str, float]]]:
+        return summarize(self.records)
+
+
+def enable(sink, trace_memory: bool = False) -> None:
+    """
+    Enable instrumentation and route records to `sink`
+
+    Replaces any configuration that is already enabled.
+
+    Args:
+        sink: Object with an `emit(record)` method (MemorySink, JsonLinesSink)
+        trace_memory: Track peak allocated bytes via tracemalloc. Slows down
+            Python-loop stages, so leave off when comparing wall times.
+            Peaks are not measured if the caller already started tracemalloc.
+    """
+    global _state
+    disable()
+    _state = _State(sink, trace_memory)
+
+
+def disable() -> None:
+    """Disable instrumentation (no-op if already disabled)"""
+    global _state
+    if _state is not None:
+        _state.close()
+    _state = None
+
+
+def is_enabled() -> bool:
+    """Return True if instrumentation is currently enabled"""
+    return _state is not None
+
+
+@contextmanager
+def instrumented(sink, trace_memory: bool = False):
+    """
+    Enable instrumentation for the duration of a `with` block
+
+    Nested blocks restore the enclosing configuration on exit.
+
+    Args:
+        sink: Record sink
+        trace_memory: Track peak allocated bytes via tracemalloc (see `enable`)
+
+    Yields:
+        The sink passed in
+    """
+    global _state
+    previous = _state
+    state = _State(sink, trace_memory, previous)
+    _state = state
+    try:
+        yield sink
+    finally:
+        state.close()
+        _state = previous
+
+
+def stage(name: str, rows: int = 0):
+    """
+    Measure a stage of the batch code
+
+    Args:
+        name: Stage name (see STAGE_* constants)
+        rows: Number of rows processed (can be increased with `add_rows`)
+
+    Returns:
+        Context manager; a shared no-op object when instrumentation is disabled
+    """
+    if _state is None:
+        return _NULL
+    return _Stage(_state, name, int(rows))
+
+
+def collect():
+    """
+    Capture the records emitted within a `with` block
+
+    Returns:
+        Context manager whose `summary()` aggregates the captured records,
+        or None when instrumentation is disabled
+    """
+    if _state is None:
+        return _NULL
+    return _Collector(_state)
+
+
+def summarize(records: Iterable[StageRecord]) -> Dict[str, Dict[str, float]]:
+    """
+    Aggregate stage records per stage name
+
+    Args:
+        records: Stage records
+
+    Returns:
+        {stage: {wall_time, calls, rows, peak_bytes}} with wall time, calls and
+        rows summed and peak_bytes the maximum over all executions
+    """
+    summary: Dict[str, Dict[str, float]] = {}
+    for record in records:
+        entry = summary.setdefault(record.stage, {
+            'wall_time': 0.0,
+            'calls': 0,
+            'rows': 0,
+            'peak_bytes': 0
+        })
+        entry['wall_time'] += record.wall_time
+        entry['calls'] += record.calls
+        entry['rows'] += record.rows
+        entry['peak_bytes'] = max(entry['peak_bytes'], record.peak_bytes)
+    return summary
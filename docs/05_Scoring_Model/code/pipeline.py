@@ -0,0 +1,221 @@
+"""
+Streaming Calibrate -> p_mis -> Threshold Pipeline
+
+This module chains temperature scaling, misclassification probability and
+threshold optimization for the monthly batch job. It consumes raw score
+blocks instead of full arrays:
+
+  Pass 1: fit the temperature (NLL for every candidate T), ECE/AUC at T=1
+  Pass 2: derive calibrated p_mis per block at the fitted T and feed it
+          straight into the threshold and ECE accumulators
+
+No intermediate array covers more than one block.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+import numpy as np
+
+try:
+    from . import instrumentation
+    from .calibration import ECEAccumulator, TempFit, TemperatureAccumulator, softmax
+    from .threshold_optimizer import ThresholdAccumulator, ThresholdResult
+except ImportError:
+    import instrumentation
+    from calibration import ECEAccumulator, TempFit, TemperatureAccumulator, softmax
+    from threshold_optimizer import ThresholdAccumulator, ThresholdResult
+
+
+Block = Tuple[np.ndarray, np.ndarray]
+BlockSource = Union[Iterable[Block], Callable[[], Iterable[Block]]]
+
+
+@dataclass
+class PipelineResult:
+    """Combined result of the calibrate -> p_mis -> threshold pipeline"""
+    temperature: float
+    temp_fit: TempFit
+    thresholds: ThresholdResult
+    auc_before: float
+    auc_after: float
+    ece_before: float
+    ece_after: float
+    n_samples: int
+    instrumentation: Optional[Dict[str, Dict[str, float]]] = None
+
+
+def misclassification_block(
+    raw_scores: np.ndarray,
+    labels: np.ndarray,
+    temperature: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute p_mis and correctness for one block of raw scores
+
+    Args:
+        raw_scores: Shape (n_block, n_candidates) - raw model scores
+        labels: Shape (n_block,) - correct candidate index for each sample
+        temperature: Temperature for scaling
+
+    Returns:
+        (p_mis, correct) where p_mis = 1 - max(P(C_k)) and correct is 1 when
+        the top candidate is the labelled one (1=CORRECT, 0=INCORRECT)
+    """
+    return misclassification_from_probs(softmax(raw_scores, temperature=temperature), labels)
+
+
+def misclassification_from_probs(
+    probs: np.ndarray,
+    labels: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute p_mis and correctness from already computed probabilities
+
+    Args:
+        probs: Shape (n_block, n_candidates) - softmax probabilities
+        labels: Shape (n_block,) - correct candidate index for each sample
+
+    Returns:
+        (p_mis, correct) as in `misclassification_block`
+    """
+    p_mis = 1.0 - np.max(probs, axis=1)
+    correct = (np.argmax(probs, axis=1) == labels).astype(int)
+    return p_mis, correct
+
+
+class ScoringPipeline:
+    """
+    Lazy end-to-end calibration and threshold optimization
+
+    Nothing is read until `run()` is called. The block source is iterated
+    twice, so it must be either a re-iterable collection (e.g. a list of
+    blocks) or a callable returning a fresh iterable on every call
+    (e.g. a function that re-reads the month's score files).
+    """
+
+    def __init__(
+        self,
+        blocks: BlockSource,
+        search_range: Tuple[float, float] = (0.1, 5.0),
+        n_steps: int = 100,
+        ece_bins: int = 10,
+        threshold_bins: int = 1000
+    ):
+        """
+        Args:
+            blocks: Source of (raw_scores, labels) blocks; raw_scores has shape
+                (n_block, n_candidates), labels holds the correct candidate index
+            search_range: Temperature search range (min, max)
+            n_steps: Number of temperature values to test
+            ece_bins: Number of bins for ECE
+            threshold_bins: Number of p_mis histogram bins for threshold search
+        """
+        self.blocks = blocks
+        self.search_range = search_range
+        self.n_steps = n_steps
+        self.ece_bins = ece_bins
+        self.threshold_bins = threshold_bins
+
+    def _iter_blocks(self) -> Iterator[Block]:
+        source = self.blocks() if callable(self.blocks) else self.blocks
+        for raw_scores, labels in source:
+            with instrumentation.stage(instrumentation.STAGE_INGEST, rows=len(labels)):
+                raw_scores = np.asarray(raw_scores, dtype=float)
+                labels = np.asarray(labels, dtype=int)
+
+            if raw_scores.ndim != 2 or len(raw_scores) != len(labels):
+                raise ValueError("Score blocks must have shape (n_block, n_candidates) matching labels")
+            yield raw_scores, labels
+
+    def run(self) -> PipelineResult:
+        """
+        Run both passes over the block source
+
+        Returns:
+            PipelineResult with temperature, thresholds, AUC and ECE
+            before (T=1) and after (fitted T) calibration
+        """
+        with instrumentation.collect() as collector:
+            # Pass 1: temperature fit and uncalibrated metrics
+            temp_acc = TemperatureAccumulator(self.search_range, self.n_steps)
+            ece_before = ECEAccumulator(self.ece_bins)
+            roc_before = ThresholdAccumulator(self.threshold_bins)
+
+            for raw_scores, labels in self._iter_blocks():
+                # T=1 probabilities feed both the base NLL and the uncalibrated p_mis
+                with instrumentation.stage(instrumentation.STAGE_P_MIS, rows=len(labels)):
+                    base_probs = softmax(raw_scores, temperature=1.0)
+                    p_mis, correct = misclassification_from_probs(base_probs, labels)
+                with instrumentation.stage(instrumentation.STAGE_TEMPERATURE_SEARCH, rows=len(labels)):
+                    temp_acc.add(raw_scores, labels, base_probs=base_probs)
+                with instrumentation.stage(instrumentation.STAGE_ECE, rows=len(labels)):
+                    ece_before.add(1.0 - p_mis, correct)
+                with instrumentation.stage(instrumentation.STAGE_ROC_SWEEP, rows=len(labels)):
+                    roc_before.add(p_mis, correct)
+
+            temp_fit = temp_acc.result()
+
+            # Pass 2: calibrated p_mis straight into the accumulators
+            ece_after = ECEAccumulator(self.ece_bins)
+            roc_after = ThresholdAccumulator(self.threshold_bins)
+
+            for raw_scores, labels in self._iter_blocks():
+                with instrumentation.stage(instrumentation.STAGE_P_MIS, rows=len(labels)):
+                    p_mis, correct = misclassification_block(raw_scores, labels, temp_fit.temperature)
+                with instrumentation.stage(instrumentation.STAGE_ECE, rows=len(labels)):
+                    ece_after.add(1.0 - p_mis, correct)
+                with instrumentation.stage(instrumentation.STAGE_ROC_SWEEP, rows=len(labels)):
+                    roc_after.add(p_mis, correct)
+
+            if roc_after.n_samples != temp_acc.n_samples:
+                raise ValueError(
+                    f"Block source yielded {temp_acc.n_samples} rows on the first pass "
+                    f"and {roc_after.n_samples} on the second; pass a list or a callable"
+                )
+
+            # Reads only the fixed-size histograms, so no sample rows are processed
+            with instrumentation.stage(instrumentation.STAGE_ROC_SWEEP):
+                thresholds = roc_after.result()
+                auc_before = roc_before.auc()
+                auc_after = roc_after.auc()
+
+        return PipelineResult(
+            temperature=float(temp_fit.temperature),
+            temp_fit=temp_fit,
+            thresholds=thresholds,
+            auc_before=auc_before,
+            auc_after=auc_after,
+            ece_before=ece_before.value(),
+            ece_after=ece_after.value(),
+            n_samples=temp_acc.n_samples,
+            instrumentation=collector.summary()
+        )
+
+
+if __name__ == "__main__":
+    # Example usage
+    import json
+
+    np.random.seed(42)
+
+    # Simulate an overconfident model (true temperature 2.0) over a month
+    # of raw scores, delivered in blocks of 1000 samples
+    raw_scores = np.random.randn(10000, 5) * 3.0
+    true_probs = softmax(raw_scores, temperature=2.0)
+    draws = np.random.rand(10000, 1)
+    labels = np.minimum(np.sum(np.cumsum(true_probs, axis=1) < draws, axis=1), 4)
+    blocks = [(raw_scores[i:i + 1000], labels[i:i + 1000]) for i in range(0, 10000, 1000)]
+
+    result = ScoringPipeline(blocks).run()
+
+    print("Pipeline Results:")
+    print(json.dumps({
+        "temperature": result.temperature,
+        "threshold_auto": result.thresholds.threshold_auto,
+        "threshold_escalate": result.thresholds.threshold_escalate,
+        "auc_before": result.auc_before,
+        "auc_after": result.auc_after,
+        "ece_before": result.ece_before,
+        "ece_after": result.ece_after,
+        "n_samples": result.n_samples
+    }, indent=2))
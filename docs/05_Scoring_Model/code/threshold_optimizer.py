@@ -7,9 +7,14 @@ using historical data and ROC analysis.
 """
 
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 
+try:
+    from . import instrumentation
+except ImportError:
+    import instrumentation
+
 
 @dataclass
 class ThresholdResult:
@@ -20,6 +25,7 @@ class ThresholdResult:
     youden_escalate: float
     n_samples: int
     timestamp: str
+    instrumentation: Optional[Dict[str, Dict[str, float]]] = None
 
 
 def youden_index(tpr: float, fpr: float) -> float:
@@ -81,8 +87,9 @@ def optimize_thresholds(
     Returns:
         (threshold_auto, threshold_escalate, youden_auto, youden_escalate)
     """
-    p_mis = np.array(misclass_probs)
-    y = np.array(labels)
+    with instrumentation.stage(instrumentation.STAGE_INGEST, rows=len(misclass_probs)):
+        p_mis = np.array(misclass_probs)
+        y = np.array(labels)
     
     if len(p_mis) == 0:
         raise ValueError("Empty input arrays")
@@ -92,7 +99,8 @@ def optimize_thresholds(
     
     # Get unique thresholds to test
     # Include 0, 1, and all p_mis values
-    thresholds = sorted(set([0.0, 1.0] + list(p_mis)))
+    with instrumentation.stage(instrumentation.STAGE_SORT, rows=len(p_mis)):
+        thresholds = sorted(set([0.0, 1.0] + list(p_mis)))
     
     best_j_auto = -1.0
     best_threshold_auto = 0.5
@@ -100,29 +108,30 @@ def optimize_thresholds(
     best_j_escalate = -1.0
     best_threshold_escalate = 0.5
     
-    # For AUTO threshold: optimize on all data
-    # We want to maximize TPR-FPR (correctly identify CORRECT answers)
-    for threshold in thresholds:
-        tpr, fpr = compute_roc_point(threshold, p_mis, y)
-        j = youden_index(tpr, fpr)
+    with instrumentation.stage(instrumentation.STAGE_ROC_SWEEP, rows=len(p_mis)):
+        # For AUTO threshold: optimize on all data
+        # We want to maximize TPR-FPR (correctly identify CORRECT answers)
+        for threshold in thresholds:
+            tpr, fpr = compute_roc_point(threshold, p_mis, y)
+            j = youden_index(tpr, fpr)
+            
+            if j > best_j_auto:
+                best_j_auto = j
+                best_threshold_auto = threshold
         
-        if j > best_j_auto:
-            best_j_auto = j
-            best_threshold_auto = threshold
-    
-    # For ESCALATE threshold: optimize using different perspective
-    # We want to identify cases that NEED escalation (incorrect decisions)
-    # So we're looking at False Negative Rate (missed escalations)
-    # Flip perspective: escalate_needed = NOT(label)
-    escalate_needed = 1 - y
-    
-    for threshold in thresholds:
-        tpr, fpr = compute_roc_point(threshold, p_mis, escalate_needed)
-        j = youden_index(tpr, fpr)
+        # For ESCALATE threshold: optimize using different perspective
+        # We want to identify cases that NEED escalation (incorrect decisions)
+        # So we're looking at False Negative Rate (missed escalations)
+        # Flip perspective: escalate_needed = NOT(label)
+        escalate_needed = 1 - y
         
-        if j > best_j_escalate:
-            best_j_escalate = j
-            best_threshold_escalate = threshold
+        for threshold in thresholds:
+            tpr, fpr = compute_roc_point(threshold, p_mis, escalate_needed)
+            j = youden_index(tpr, fpr)
+            
+            if j > best_j_escalate:
+                best_j_escalate = j
+                best_threshold_escalate = threshold
     
     return best_threshold_auto, best_threshold_escalate, best_j_auto, best_j_escalate
 
@@ -142,12 +151,14 @@ def optimize_thresholds_with_metadata(
     
     Returns:
         ThresholdResult with optimization results and metadata
+        (`instrumentation` holds a per-stage summary when instrumentation is enabled)
     """
     from datetime import datetime
     
-    threshold_auto, threshold_escalate, j_auto, j_escalate = optimize_thresholds(
-        misclass_probs, labels, method
-    )
+    with instrumentation.collect() as collector:
+        threshold_auto, threshold_escalate, j_auto, j_escalate = optimize_thresholds(
+            misclass_probs, labels, method
+        )
     
     return ThresholdResult(
         threshold_auto=threshold_auto,
@@ -155,10 +166,109 @@ def optimize_thresholds_with_metadata(
         youden_auto=j_auto,
         youden_escalate=j_escalate,
         n_samples=len(misclass_probs),
-        timestamp=datetime.utcnow().isoformat()
+        timestamp=datetime.utcnow().isoformat(),
+        instrumentation=collector.summary()
     )
 
 
+class ThresholdAccumulator:
+    """
+    Streaming version of `optimize_thresholds` and `compute_auc`
+    
+    Counts CORRECT/INCORRECT samples per p_mis histogram bin, so thresholds,
+    Youden indices and AUC can be computed block by block without keeping
+    every p_mis value. Candidate thresholds are the bin edges instead of the
+    unique p_mis values, so results are exact up to the bin width.
+    """
+    
+    def __init__(self, n_bins: int = 1000):
+        self.thresholds = np.linspace(0.0, 1.0, n_bins + 1)
+        # One extra bin for p_mis >= 1.0, which no threshold predicts positive
+        self.positive_counts = np.zeros(n_bins + 1)
+        self.negative_counts = np.zeros(n_bins + 1)
+        self.n_samples = 0
+    
+    def add(self, misclass_probs: np.ndarray, labels: np.ndarray) -> None:
+        """
+        Accumulate one block
+        
+        Args:
+            misclass_probs: Misclassification probabilities
+            labels: Ground truth labels (1=CORRECT, 0=INCORRECT)
+        """
+        p_mis = np.asarray(misclass_probs, dtype=float)
+        y = np.asarray(labels)
+        
+        if not np.all((y == 0) | (y == 1)):
+            raise ValueError("Labels must be binary (0 or 1)")
+        
+        # Bin i holds thresholds[i] <= p_mis < thresholds[i+1]
+        idx = np.searchsorted(self.thresholds, p_mis, side='right') - 1
+        idx = np.clip(idx, 0, len(self.positive_counts) - 1)
+        
+        n_bins = len(self.positive_counts)
+        self.positive_counts += np.bincount(idx[y == 1], minlength=n_bins)
+        self.negative_counts += np.bincount(idx[y == 0], minlength=n_bins)
+        self.n_samples += len(p_mis)
+    
+    def roc_curve(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (fpr, tpr, thresholds) with p_mis < threshold predicted CORRECT
+        """
+        # Samples with p_mis < thresholds[k] are those in bins 0..k-1
+        tp = np.concatenate([[0.0], np.cumsum(self.positive_counts)[:-1]])
+        fp = np.concatenate([[0.0], np.cumsum(self.negative_counts)[:-1]])
+        n_pos = self.positive_counts.sum()
+        n_neg = self.negative_counts.sum()
+        
+        tpr = tp / n_pos if n_pos > 0 else np.zeros_like(tp)
+        fpr = fp / n_neg if n_neg > 0 else np.zeros_like(fp)
+        
+        return fpr, tpr, self.thresholds
+    
+    def auc(self) -> float:
+        """
+        Returns:
+            AUC score in [0, 1] (trapezoid rule, as in `compute_auc`)
+        """
+        fpr, tpr, _ = self.roc_curve()
+        return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    
+    def result(self) -> ThresholdResult:
+        """
+        Returns:
+            ThresholdResult with optimization results and metadata
+        """
+        from datetime import datetime
+        
+        if self.n_samples == 0:
+            raise ValueError("Empty input arrays")
+        
+        fpr, tpr, thresholds = self.roc_curve()
+        
+        # AUTO uses labels as-is; ESCALATE flips them, which swaps TPR and FPR
+        threshold_auto, j_auto = _best_youden(youden_index(tpr, fpr), thresholds)
+        threshold_escalate, j_escalate = _best_youden(youden_index(fpr, tpr), thresholds)
+        
+        return ThresholdResult(
+            threshold_auto=threshold_auto,
+            threshold_escalate=threshold_escalate,
+            youden_auto=j_auto,
+            youden_escalate=j_escalate,
+            n_samples=self.n_samples,
+            timestamp=datetime.utcnow().isoformat()
+        )
+
+
+def _best_youden(j: np.ndarray, thresholds: np.ndarray) -> Tuple[float, float]:
+    """First threshold with maximal J, matching the strict `>` scan in optimize_thresholds"""
+    best = int(np.argmax(j))
+    if j[best] > -1.0:
+        return float(thresholds[best]), float(j[best])
+    return 0.5, -1.0
+
+
 def compute_roc_curve(
     misclass_probs: List[float],
     labels: List[int]
@@ -173,18 +283,21 @@ def compute_roc_curve(
     Returns:
         (fpr_list, tpr_list, thresholds_list)
     """
-    p_mis = np.array(misclass_probs)
-    y = np.array(labels)
+    with instrumentation.stage(instrumentation.STAGE_INGEST, rows=len(misclass_probs)):
+        p_mis = np.array(misclass_probs)
+        y = np.array(labels)
     
-    thresholds = sorted(set([0.0, 1.0] + list(p_mis)))
+    with instrumentation.stage(instrumentation.STAGE_SORT, rows=len(p_mis)):
+        thresholds = sorted(set([0.0, 1.0] + list(p_mis)))
     
     fpr_list = []
     tpr_list = []
     
-    for threshold in thresholds:
-        tpr, fpr = compute_roc_point(threshold, p_mis, y)
-        fpr_list.append(fpr)
-        tpr_list.append(tpr)
+    with instrumentation.stage(instrumentation.STAGE_ROC_SWEEP, rows=len(p_mis)):
+        for threshold in thresholds:
+            tpr, fpr = compute_roc_point(threshold, p_mis, y)
+            fpr_list.append(fpr)
+            tpr_list.append(tpr)
     
     return fpr_list, tpr_list, thresholds
 
@@ -234,3 +347,10 @@ if __name__ == "__main__":
         "n_samples": result.n_samples,
         "timestamp": result.timestamp
     }, indent=2))
+    
+    # Same run with per-stage instrumentation
+    with instrumentation.instrumented(instrumentation.MemorySink()):
+        result = optimize_thresholds_with_metadata(p_mis_vals, true_labels)
+    
+    print("\nInstrumentation:")
+    print(json.dumps(result.instrumentation, indent=2))
@@ -0,0 +1,195 @@
+"""
+pytest tests for batch instrumentation
+"""
+
+import json
+import tracemalloc
+
+import pytest
+import numpy as np
+from code import instrumentation
+from code.instrumentation import JsonLinesSink, MemorySink, instrumented
+from code.threshold_optimizer import optimize_thresholds_with_metadata
+from code.calibration import (
+    expected_calibration_error,
+    fit_temperature,
+    platt_scaling_coefficients
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_instrumentation():
+    """Make sure no test leaves instrumentation enabled"""
+    yield
+    instrumentation.disable()
+
+
+class TestDisabled:
+    """Tests for the default (disabled) state"""
+
+    def test_disabled_by_default(self):
+        """Stages return the shared no-op object"""
+        assert not instrumentation.is_enabled()
+        assert instrumentation.stage('ingest') is instrumentation.stage('sort')
+
+    def test_no_summary_when_disabled(self):
+        """Results carry no summary when instrumentation is off"""
+        result = optimize_thresholds_with_metadata([0.1, 0.2, 0.8, 0.9], [1, 1, 0, 0])
+        assert result.instrumentation is None
+
+    def test_noop_collect_propagates_stage_error(self):
+        """The no-op collector neither swallows errors nor produces a summary"""
+        with pytest.raises(RuntimeError):
+            with instrumentation.collect() as collector:
+                with instrumentation.stage('ingest'):
+                    raise RuntimeError("boom")
+
+        assert collector.summary() is None
+
+
+class TestThresholdInstrumentation:
+    """Tests for threshold optimizer stages"""
+
+    def test_stages_recorded(self):
+        """Ingest, sort and ROC sweep are recorded once with row counts"""
+        sink = MemorySink()
+        with instrumented(sink):
+            result = optimize_thresholds_with_metadata(
+                [0.1, 0.2, 0.3, 0.8, 0.9], [1, 1, 1, 0, 0]
+            )
+
+        assert set(result.instrumentation) == {'ingest', 'sort', 'roc_sweep'}
+        for entry in result.instrumentation.values():
+            assert entry['calls'] == 1
+            assert entry['rows'] == 5
+            assert entry['wall_time'] >= 0.0
+            assert entry['peak_bytes'] >= 0
+        assert len(sink.records) == 3
+
+    def test_disabled_after_context(self):
+        """Leaving `instrumented` disables instrumentation"""
+        with instrumented(MemorySink()):
+            assert instrumentation.is_enabled()
+        assert not instrumentation.is_enabled()
+
+    def test_nested_context_restores_outer(self):
+        """Leaving a nested `instrumented` keeps the outer one recording"""
+        outer = MemorySink()
+        with instrumented(outer, trace_memory=True):
+            with instrumented(MemorySink()):
+                pass
+            assert instrumentation.is_enabled()
+            assert tracemalloc.is_tracing()
+            with instrumentation.stage('sort'):
+                pass
+
+        assert [record.stage for record in outer.records] == ['sort']
+        assert not tracemalloc.is_tracing()
+
+
+class TestCalibrationInstrumentation:
+    """Tests for calibration stages"""
+
+    def test_temperature_search_recorded(self):
+        """TempFit carries the temperature search summary"""
+        np.random.seed(42)
+        raw_scores = np.random.randn(50, 4)
+        labels = np.argmax(raw_scores, axis=1)
+
+        with instrumented(MemorySink()):
+            result = fit_temperature(raw_scores, labels, n_steps=10)
+
+        assert result.instrumentation['temperature_search']['rows'] == 50
+        assert result.instrumentation['ingest']['calls'] == 1
+
+    def test_peak_bytes_tracks_allocation(self):
+        """Peak bytes reflect the softmax temporaries"""
+        raw_scores = np.zeros((20000, 5))
+        labels = np.zeros(20000, dtype=int)
+
+        with instrumented(MemorySink(), trace_memory=True):
+            result = fit_temperature(raw_scores, labels, n_steps=2)
+
+        # At least one (n_samples, n_candidates) float64 temporary
+        assert result.instrumentation['temperature_search']['peak_bytes'] >= 20000 * 5 * 8
+
+    def test_ece_and_platt_recorded(self):
+        """ECE and Platt scaling each record their own stage"""
+        np.random.seed(0)
+        scores = np.random.randn(40)
+        labels = (scores + np.random.randn(40) > 0).astype(int)
+
+        sink = MemorySink()
+        with instrumented(sink):
+            expected_calibration_error(np.random.uniform(0, 1, 40), labels)
+            platt_scaling_coefficients(scores, labels)
+
+        summary = sink.summary()
+        assert summary['ece']['calls'] == 1
+        assert summary['ece']['rows'] == 40
+        assert summary['platt']['calls'] == 1
+        assert summary['platt']['rows'] == 40
+        assert summary['ingest']['calls'] == 2
+
+
+class TestMemoryTracing:
+    """Tests for peak memory measurement"""
+
+    def test_off_by_default(self):
+        """Records report untraced memory unless tracing is requested"""
+        sink = MemorySink()
+        with instrumented(sink):
+            with instrumentation.stage('sort'):
+                pass
+
+        assert sink.records[0].memory_traced is False
+        assert sink.records[0].peak_bytes == 0
+
+    def test_nested_stage_peak_carries_over(self):
+        """An inner stage resetting the peak does not hide the outer peak"""
+        sink = MemorySink()
+        with instrumented(sink, trace_memory=True):
+            with instrumentation.stage('outer'):
+                big = np.ones(1_000_000)  # 8 MB, freed before the inner stage
+                del big
+                with instrumentation.stage('inner'):
+                    small = np.ones(1000)
+                    del small
+
+        records = {record.stage: record for record in sink.records}
+        assert records['outer'].peak_bytes >= 8_000_000
+        assert records['inner'].peak_bytes < 1_000_000
+        assert records['outer'].memory_traced
+
+    def test_caller_started_tracing_is_left_alone(self):
+        """Peaks of a caller-owned trace are not reset"""
+        tracemalloc.start()
+        try:
+            big = np.ones(1_000_000)
+            del big
+            with instrumented(MemorySink(), trace_memory=True) as sink:
+                with instrumentation.stage('sort'):
+                    pass
+            assert tracemalloc.get_traced_memory()[1] >= 8_000_000
+            assert tracemalloc.is_tracing()
+            assert sink.records[0].memory_traced is False
+        finally:
+            tracemalloc.stop()
+
+
+class TestJsonLinesSink:
+    """Tests for the JSON lines sink"""
+
+    def test_writes_one_line_per_stage(self, tmp_path):
+        """Each stage execution becomes one JSON object"""
+        path = tmp_path / 'stages.jsonl'
+        with instrumented(JsonLinesSink(str(path))):
+            optimize_thresholds_with_metadata([0.1, 0.9], [1, 0])
+
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [line['stage'] for line in lines] == ['ingest', 'sort', 'roc_sweep']
+        assert set(lines[0]) == {'stage', 'wall_time', 'calls', 'rows', 'peak_bytes', 'memory_traced'}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,151 @@
+"""
+pytest tests for the streaming calibration/threshold pipeline
+"""
+
+import pytest
+import numpy as np
+from code.calibration import (
+    ECEAccumulator,
+    TemperatureAccumulator,
+    expected_calibration_error,
+    fit_temperature,
+    softmax
+)
+from code.threshold_optimizer import ThresholdAccumulator, optimize_thresholds
+from code.pipeline import ScoringPipeline, misclassification_block
+from code.instrumentation import MemorySink, instrumented
+
+
+def make_month(n_samples=5000, true_temperature=2.0, seed=42):
+    """Raw scores with labels drawn from the softmax at `true_temperature`"""
+    rng = np.random.RandomState(seed)
+    raw_scores = rng.randn(n_samples, 5) * 3.0
+    probs = softmax(raw_scores, temperature=true_temperature)
+    draws = rng.rand(n_samples, 1)
+    labels = np.minimum(np.sum(np.cumsum(probs, axis=1) < draws, axis=1), 4)
+    return raw_scores, labels
+
+
+def as_blocks(raw_scores, labels, block_size=700):
+    return [
+        (raw_scores[i:i + block_size], labels[i:i + block_size])
+        for i in range(0, len(labels), block_size)
+    ]
+
+
+class TestAccumulators:
+    """Streaming accumulators agree with the batch functions"""
+
+    def test_temperature_matches_fit_temperature(self):
+        """Block-wise NLL sums pick the same T as fit_temperature"""
+        raw_scores, labels = make_month(1000)
+        acc = TemperatureAccumulator(n_steps=30)
+        for block_scores, block_labels in as_blocks(raw_scores, labels):
+            acc.add(block_scores, block_labels)
+
+        streamed = acc.result()
+        batch = fit_temperature(raw_scores, labels, n_steps=30)
+
+        assert streamed.temperature == pytest.approx(batch.temperature)
+        assert streamed.nll_after == pytest.approx(batch.nll_after)
+        assert streamed.nll_before == pytest.approx(batch.nll_before)
+
+    def test_ece_matches_expected_calibration_error(self):
+        """Block-wise bin sums give the same ECE as expected_calibration_error"""
+        rng = np.random.RandomState(0)
+        probs = rng.uniform(0, 1, 500)
+        labels = rng.binomial(1, 0.5, 500)
+
+        acc = ECEAccumulator()
+        acc.add(probs[:123], labels[:123])
+        acc.add(probs[123:], labels[123:])
+
+        assert acc.value() == pytest.approx(expected_calibration_error(probs, labels))
+
+    def test_thresholds_match_on_grid_values(self):
+        """Exact agreement when every p_mis lies on a bin edge"""
+        rng = np.random.RandomState(1)
+        p_mis = np.round(rng.uniform(0, 1, 400), 2)
+        labels = rng.binomial(1, 0.5, 400)
+
+        acc = ThresholdAccumulator(n_bins=100)
+        acc.add(p_mis[:200], labels[:200])
+        acc.add(p_mis[200:], labels[200:])
+        result = acc.result()
+
+        auto, escalate, j_auto, j_escalate = optimize_thresholds(p_mis.tolist(), labels.tolist())
+        assert result.threshold_auto == pytest.approx(auto)
+        assert result.threshold_escalate == pytest.approx(escalate)
+        assert result.youden_auto == pytest.approx(j_auto)
+        assert result.youden_escalate == pytest.approx(j_escalate)
+        assert result.n_samples == 400
+
+    def test_threshold_requires_binary_labels(self):
+        """Should raise error on non-binary labels"""
+        with pytest.raises(ValueError):
+            ThresholdAccumulator().add([0.1, 0.2], [0, 2])
+
+    def test_threshold_requires_non_empty_input(self):
+        """Should raise error when no block was added"""
+        with pytest.raises(ValueError):
+            ThresholdAccumulator().result()
+
+
+class TestScoringPipeline:
+    """Tests for the end-to-end pipeline"""
+
+    def test_recovers_temperature_and_improves_ece(self):
+        """Fitted T is close to the true temperature and ECE improves"""
+        raw_scores, labels = make_month()
+        result = ScoringPipeline(as_blocks(raw_scores, labels)).run()
+
+        assert result.temperature == pytest.approx(2.0, abs=0.3)
+        assert result.ece_after < result.ece_before
+        assert result.n_samples == 5000
+        assert result.thresholds.n_samples == 5000
+        assert 0.0 <= result.thresholds.threshold_auto <= 1.0
+        assert 0.5 < result.auc_after <= 1.0
+
+    def test_matches_batch_workflow(self):
+        """Same temperature and ECE as the separate batch calls"""
+        raw_scores, labels = make_month(2000)
+        result = ScoringPipeline(as_blocks(raw_scores, labels), n_steps=50).run()
+
+        batch_fit = fit_temperature(raw_scores, labels, n_steps=50)
+        p_mis, correct = misclassification_block(raw_scores, labels, batch_fit.temperature)
+
+        assert result.temperature == pytest.approx(batch_fit.temperature)
+        assert result.ece_after == pytest.approx(expected_calibration_error(1.0 - p_mis, correct))
+
+    def test_accepts_callable_source(self):
+        """Callable source is re-invoked for the second pass"""
+        raw_scores, labels = make_month(1000)
+
+        def source():
+            return iter(as_blocks(raw_scores, labels))
+
+        result = ScoringPipeline(source, n_steps=20).run()
+        assert result.n_samples == 1000
+
+    def test_rejects_exhausted_generator(self):
+        """A one-shot generator cannot be read twice"""
+        raw_scores, labels = make_month(1000)
+        blocks = (block for block in as_blocks(raw_scores, labels))
+
+        with pytest.raises(ValueError):
+            ScoringPipeline(blocks, n_steps=20).run()
+
+    def test_instrumentation_summary(self):
+        """Per-block stages count each pass; the final ROC step counts no rows"""
+        raw_scores, labels = make_month(1000)
+        with instrumented(MemorySink()):
+            result = ScoringPipeline(as_blocks(raw_scores, labels), n_steps=20).run()
+
+        assert result.instrumentation['ingest']['rows'] == 2000  # two passes
+        assert result.instrumentation['p_mis']['rows'] == 2000
+        assert result.instrumentation['temperature_search']['rows'] == 1000
+        assert result.instrumentation['roc_sweep']['rows'] == 2000
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])